@@ -2,6 +2,7 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 
 # Import routes
@@ -17,15 +18,71 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     print("🚀 Starting RAG Pipeline MVP...")
     print("📁 Data directories ready")
+
+    # Warm the (optional) numba chunking kernels so the first request
+    # doesn't pay the JIT compile cost
+    from services import chunker_numba
+    chunker_numba.warmup()
+    if chunker_numba.NUMBA_AVAILABLE:
+        print("✓ Numba chunking kernels compiled")
+
+    # Construct the service singletons once at startup instead of on the
+    # first request: embedding model load, retriever, and LLM clients all
+    # move out of the request path
+    from services.embedder import init_embedder
+    from services.retriever import get_retriever
+    from services.generator import get_generator
+    from services.evaluator import get_evaluator
+
+    try:
+        # init_embedder also runs a warmup embed so the first request
+        # doesn't pay the first-pass kernel cost
+        app.state.embedder = init_embedder()
+        app.state.retriever = get_retriever()
+    except Exception as e:
+        print(f"⚠ Embedder/retriever warm-up failed: {e}")
+    app.state.generator = get_generator()
+    app.state.evaluator = get_evaluator()
+    print("✓ Service singletons initialized")
+
+    # Restore the per-config index cache persisted by the last shutdown, so
+    # queries against known doc sets skip re-chunking and re-embedding
+    from services.retriever import RETRIEVER_STATE_PATH
+    if RETRIEVER_STATE_PATH:
+        try:
+            restored = rag.load_index_cache(RETRIEVER_STATE_PATH)
+            if restored:
+                print(f"✓ Restored {restored} cached indexes from {RETRIEVER_STATE_PATH}")
+        except Exception as e:
+            print(f"⚠ Could not restore index cache: {e}")
+
     yield
     print("🛑 Shutting down...")
 
+    # Persist the cached indexes so the next startup memory-maps them back
+    # instead of re-embedding each corpus
+    if RETRIEVER_STATE_PATH:
+        try:
+            saved = rag.save_index_cache(RETRIEVER_STATE_PATH)
+            print(f"✓ Saved {saved} cached indexes to {RETRIEVER_STATE_PATH}")
+        except Exception as e:
+            print(f"⚠ Could not save index cache: {e}")
+
+    # Drain the shared LLM connection pools
+    try:
+        from services import _http
+        await _http.aclose()
+    except ImportError:
+        pass
+
 
 app = FastAPI(
     title="RAG Pipeline MVP API",
     description="Testing and optimization platform for RAG systems",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson serializes the chunk-heavy RAG/eval payloads in C
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -69,4 +126,24 @@ def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)  # Use string import for reload
\ No newline at end of file
+
+    # uvloop + httptools ship with uvicorn[standard] and roughly double
+    # asyncio throughput; fall back to the stdlib loop if missing
+    try:
+        import uvloop  # noqa: F401
+        loop_impl, http_impl = "uvloop", "httptools"
+    except ImportError:
+        loop_impl, http_impl = "asyncio", "auto"
+
+    # WEB_CONCURRENCY > 1 runs one worker per CPU-ish; reload only makes
+    # sense (and is only supported) in single-worker dev mode
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        "main:app",  # Use string import for reload/workers
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        reload=workers == 1,
+        loop=loop_impl,
+        http=http_impl
+    )
\ No newline at end of file
@@ -3,12 +3,21 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
+import asyncio
+import os
+
+import numpy as np
 
 from services.evaluator import get_evaluator
 from services.generator import get_generator
 
 router = APIRouter()
 
+# Bound on concurrent judge LLM calls (provider rate limits)
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+
+SCORE_KEYS = ("relevance", "accuracy", "completeness", "coherence", "faithfulness", "overall")
+
 
 # -------------------------------------
 # Request Models
@@ -20,6 +29,8 @@ class EvaluationRequest(BaseModel):
     expected_answer: Optional[str] = None
     context_chunks: Optional[List[str]] = None
     evaluator_model: str = "llama-3.1-8b-instant"     # OLLAMA DEFAULT
+    # Stop the judge stream once all scores have arrived (no feedback text)
+    scores_only: bool = False
 
 
 class ComparisonRequest(BaseModel):
@@ -44,11 +55,12 @@ async def evaluate_response(request: EvaluationRequest):
     """
     evaluator = get_evaluator(request.evaluator_model)
 
-    result = evaluator.evaluate_response(
+    result = await evaluator.aevaluate_response(
         query=request.query,
         generated_answer=request.generated_answer,
         expected_answer=request.expected_answer,
-        context_chunks=request.context_chunks
+        context_chunks=request.context_chunks,
+        scores_only=request.scores_only
     )
 
     return result
@@ -65,22 +77,27 @@ async def compare_pipelines(request: ComparisonRequest):
     """
     evaluator = get_evaluator()
 
-    evaluated_results = []
-
-    for result in request.results:
-        eval_result = evaluator.evaluate_response(
-            query=request.query,
-            generated_answer=result.get("answer", ""),
-            expected_answer=result.get("expected_answer"),
-            context_chunks=result.get("context_chunks", [])
-        )
+    # All pipelines share the same rubric, so pack them into as few judge
+    # requests as possible instead of one round-trip per pipeline
+    eval_results = await evaluator.aevaluate_batch([
+        {
+            "query": request.query,
+            "generated_answer": result.get("answer", ""),
+            "expected_answer": result.get("expected_answer"),
+            "context_chunks": result.get("context_chunks", [])
+        }
+        for result in request.results
+    ])
 
-        evaluated_results.append({
+    evaluated_results = [
+        {
             "config": result.get("config", {}),
             "answer": result.get("answer", ""),
             "scores": eval_result["scores"],
             "feedback": eval_result["feedback"]
-        })
+        }
+        for result, eval_result in zip(request.results, eval_results)
+    ]
 
     comparison = evaluator.compare_pipelines(evaluated_results)
 
@@ -138,15 +155,26 @@ async def batch_evaluate(queries: List[Dict[str, Any]]):
     """
     evaluator = get_evaluator()
 
-    results = []
-    for item in queries:
-        eval_result = evaluator.evaluate_response(
-            query=item.get("query", ""),
-            generated_answer=item.get("generated_answer", ""),
-            expected_answer=item.get("expected_answer"),
-            context_chunks=item.get("context_chunks", [])
-        )
+    # Evaluate all pairs concurrently under the shared concurrency bound
+    semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+    async def evaluate_one(item: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await evaluator.aevaluate_response(
+                item.get("query", ""),
+                item.get("generated_answer", ""),
+                item.get("expected_answer"),
+                item.get("context_chunks", [])
+            )
 
+    eval_results = await asyncio.gather(*[evaluate_one(item) for item in queries])
+
+    # Single pass: collect results and fill the score matrix together, then
+    # average all metrics in one reduction
+    results = []
+    scores_arr = np.empty((len(eval_results), len(SCORE_KEYS)), dtype=np.float32)
+    for i, (item, eval_result) in enumerate(zip(queries, eval_results)):
+        scores_arr[i] = [eval_result["scores"][k] for k in SCORE_KEYS]
         results.append({
             "query": item.get("query"),
             "scores": eval_result["scores"],
@@ -154,10 +182,7 @@ async def batch_evaluate(queries: List[Dict[str, Any]]):
         })
 
     if results:
-        avg_scores = {
-            k: sum(r["scores"][k] for r in results) / len(results)
-            for k in ["relevance", "accuracy", "completeness", "coherence", "faithfulness", "overall"]
-        }
+        avg_scores = dict(zip(SCORE_KEYS, scores_arr.mean(axis=0).tolist()))
     else:
         avg_scores = {}
 
@@ -1,16 +1,186 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+import json
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import pickle
 import time
 
 from services.chunker import create_chunks
 from services.embedder import get_embedder
-from services.retriever import get_retriever
+from services.retriever import FAISSRetriever, get_retriever
 from services.generator import get_generator
+from services.semantic_cache import SemanticQueryCache, get_query_cache
 from routes.upload import get_docs_store
 
 router = APIRouter()
 
+# ------------------------------
+# Chunk / Index caches
+# ------------------------------
+# Chunk lists are memoized per (doc_id, text_hash, chunk_size, overlap, method)
+# and built indexes per doc-set config, so repeated queries against the same
+# configuration skip re-chunking and re-embedding entirely.
+
+MAX_CACHED_CHUNK_SETS = int(os.getenv("RAG_CHUNK_CACHE_SIZE", "64"))
+MAX_CACHED_INDEXES = int(os.getenv("RAG_INDEX_CACHE_SIZE", "8"))
+
+# Bound on concurrent per-config pipelines in /run-experiment (provider rate limits)
+EXPERIMENT_CONCURRENCY = int(os.getenv("RAG_EXPERIMENT_CONCURRENCY", "4"))
+
+CHUNK_CACHE: "OrderedDict[Tuple, List[str]]" = OrderedDict()
+INDEX_CACHE: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+
+
+def _doc_text_hash(doc: Dict[str, Any]) -> str:
+    """Get (or lazily compute) the content hash of a document's text"""
+    text_hash = doc.get("text_hash")
+    if not text_hash:
+        text_hash = hashlib.sha1(doc.get("text", "").encode("utf-8")).hexdigest()
+        doc["text_hash"] = text_hash
+    return text_hash
+
+
+def _get_cached_chunks(
+    doc_id: str,
+    doc: Dict[str, Any],
+    chunk_size: int,
+    overlap_percent: int
+) -> List[str]:
+    """Chunk a document, memoized by content hash and chunking config"""
+    key = (doc_id, _doc_text_hash(doc), chunk_size, overlap_percent, "words")
+
+    if key in CHUNK_CACHE:
+        CHUNK_CACHE.move_to_end(key)
+        return CHUNK_CACHE[key]
+
+    chunks_dict = create_chunks(
+        doc.get("text", ""),
+        [chunk_size],
+        overlap_percent=overlap_percent,
+        method="words"
+    )
+    chunks = chunks_dict.get(str(chunk_size), [])
+
+    CHUNK_CACHE[key] = chunks
+    if len(CHUNK_CACHE) > MAX_CACHED_CHUNK_SETS:
+        CHUNK_CACHE.popitem(last=False)
+
+    return chunks
+
+
+def _get_or_build_index(
+    docs_store: Dict[str, Dict[str, Any]],
+    doc_ids: List[str],
+    chunk_size: int,
+    overlap_percent: int
+) -> Tuple[FAISSRetriever, int]:
+    """
+    Get a ready-to-search retriever for this doc set + chunking config,
+    building and caching it on first use.
+
+    Returns:
+        (retriever, total_chunks) tuple
+    """
+    doc_keys = tuple(sorted(
+        (doc_id, _doc_text_hash(docs_store[doc_id])) for doc_id in doc_ids
+    ))
+    index_key = (doc_keys, chunk_size, overlap_percent, "words")
+
+    if index_key in INDEX_CACHE:
+        INDEX_CACHE.move_to_end(index_key)
+        entry = INDEX_CACHE[index_key]
+        return entry["retriever"], entry["total_chunks"]
+
+    retriever = FAISSRetriever()
+
+    # Collect chunks across all docs so embedding happens in one batched call
+    all_chunks: List[str] = []
+    all_doc_ids: List[str] = []
+
+    for doc_id in doc_ids:
+        doc = docs_store[doc_id]
+        if not doc.get("text"):
+            continue
+
+        chunks = _get_cached_chunks(doc_id, doc, chunk_size, overlap_percent)
+        all_chunks.extend(chunks)
+        all_doc_ids.extend([doc_id] * len(chunks))
+
+    total_chunks = len(all_chunks)
+
+    retriever.add_documents_batch(
+        chunks=all_chunks,
+        doc_ids=all_doc_ids,
+        chunk_size=chunk_size
+    )
+
+    INDEX_CACHE[index_key] = {"retriever": retriever, "total_chunks": total_chunks}
+    if len(INDEX_CACHE) > MAX_CACHED_INDEXES:
+        INDEX_CACHE.popitem(last=False)
+
+    return retriever, total_chunks
+
+
+def save_index_cache(path: str) -> int:
+    """
+    Persist every cached retriever under a path prefix so the next startup
+    serves queries without re-chunking or re-embedding.
+
+    Writes one <path>.<n>.faiss/.pkl pair per INDEX_CACHE entry plus a
+    manifest mapping each config key to its files.
+
+    Returns:
+        Number of indexes persisted
+    """
+    manifest = []
+    for n, (key, entry) in enumerate(INDEX_CACHE.items()):
+        prefix = f"{path}.{n}"
+        entry["retriever"].save(prefix)
+        manifest.append({
+            "key": key,
+            "prefix": prefix,
+            "total_chunks": entry["total_chunks"]
+        })
+    with open(f"{path}.manifest.pkl", "wb") as f:
+        pickle.dump(manifest, f, protocol=5)
+    return len(manifest)
+
+
+def load_index_cache(path: str) -> int:
+    """
+    Restore the per-config retriever cache written by save_index_cache().
+
+    Each index file is memory-mapped, so startup cost is one open() per
+    index and pages fault in lazily per query. Entries whose files are
+    missing are skipped; config keys include document content hashes, so a
+    restored entry only ever serves the exact doc set it was built from.
+
+    Returns:
+        Number of indexes restored
+    """
+    if not os.path.exists(f"{path}.manifest.pkl"):
+        return 0
+
+    with open(f"{path}.manifest.pkl", "rb") as f:
+        manifest = pickle.load(f)
+
+    restored = 0
+    for item in manifest:
+        retriever = FAISSRetriever()
+        if not retriever.load(item["prefix"]):
+            continue
+        INDEX_CACHE[item["key"]] = {
+            "retriever": retriever,
+            "total_chunks": item["total_chunks"]
+        }
+        restored += 1
+    return restored
+
 
 # ------------------------------
 # RAG Request Models
@@ -53,35 +223,35 @@ async def run_rag(request: RAGRequest):
         if doc_id not in docs_store:
             raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
 
-    retriever = get_retriever()
-    generator = get_generator()
-
-    retriever.clear()
+    # Semantic cache lookup: a rephrased repeat of a recent query skips the
+    # whole chunk/embed/retrieve/generate pipeline
+    embedder = get_embedder()
+    query_cache = get_query_cache()
+    query_embedding = await embedder.embed_query_async(request.query)
+    cache_namespace = SemanticQueryCache.make_namespace(
+        request.doc_ids,
+        request.chunk_size,
+        request.model_name,
+        request.overlap_percent,
+        request.top_k,
+        request.temperature
+    )
 
-    total_chunks = 0
+    cached = query_cache.get(query_embedding, cache_namespace)
+    if cached is not None:
+        cached["cache_hit"] = True
+        cached["latency"] = time.time() - start_time
+        return cached
 
-    # Process each doc
-    for doc_id in request.doc_ids:
-        doc = docs_store[doc_id]
-        text = doc.get("text", "")
-
-        if not text:
-            continue
+    generator = get_generator()
 
-        chunks_dict = create_chunks(
-            text,
-            [request.chunk_size],
-            overlap_percent=request.overlap_percent,
-            method="words"
-        )
-        chunks = chunks_dict.get(str(request.chunk_size), [])
-        total_chunks += len(chunks)
-
-        retriever.add_documents(
-            chunks=chunks,
-            doc_id=doc_id,
-            chunk_size=request.chunk_size
-        )
+    # Reuse a cached index for this doc set + config; build once on miss
+    retriever, total_chunks = _get_or_build_index(
+        docs_store,
+        request.doc_ids,
+        request.chunk_size,
+        request.overlap_percent
+    )
 
     if total_chunks == 0:
         raise HTTPException(status_code=400, detail="No chunks created from documents")
@@ -108,8 +278,9 @@ async def run_rag(request: RAGRequest):
 
     context_chunks = [r["chunk"] for r in search_results]
 
-    # Generate answer using Groq with specified model
-    generation_result = generator.generate_answer(
+    # Generate answer using Groq with specified model (async client, so the
+    # event loop keeps serving other requests during the LLM round-trip)
+    generation_result = await generator.agenerate_answer(
         query=request.query,
         context_chunks=context_chunks,
         model_name=request.model_name,  # Pass model_name to generator
@@ -119,7 +290,7 @@ async def run_rag(request: RAGRequest):
 
     end_time = time.time()
 
-    return {
+    response = {
         "answer": generation_result["answer"],
         "query": request.query,
         "retrieved_chunks": search_results,
@@ -132,9 +303,85 @@ async def run_rag(request: RAGRequest):
         },
         "usage": generation_result.get("usage", {}),
         "latency": end_time - start_time,
-        "total_chunks_indexed": total_chunks
+        "total_chunks_indexed": total_chunks,
+        "cache_hit": False
     }
 
+    # Only cache real completions: a provider error surfaces as a fallback
+    # answer, and pinning that for the TTL would serve the outage to every
+    # semantically similar query in the namespace
+    if generation_result.get("model") != "fallback":
+        query_cache.put(query_embedding, cache_namespace, response)
+
+    return response
+
+
+# ------------------------------
+# Run RAG Pipeline (streaming)
+# ------------------------------
+
+@router.post("/run-rag-stream")
+async def run_rag_stream(request: RAGRequest):
+    """
+    Run the RAG pipeline but stream answer tokens via Server-Sent Events.
+
+    Emits one `chunks` event with the retrieval results, then `token`
+    events as the model generates, then a final `done` event with latency.
+    """
+    start_time = time.time()
+
+    docs_store = get_docs_store()
+
+    if not request.doc_ids:
+        raise HTTPException(status_code=400, detail="No documents specified")
+
+    for doc_id in request.doc_ids:
+        if doc_id not in docs_store:
+            raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
+
+    generator = get_generator()
+
+    retriever, total_chunks = _get_or_build_index(
+        docs_store,
+        request.doc_ids,
+        request.chunk_size,
+        request.overlap_percent
+    )
+
+    if total_chunks == 0:
+        raise HTTPException(status_code=400, detail="No chunks created from documents")
+
+    search_results = retriever.search(
+        query=request.query,
+        top_k=request.top_k
+    )
+
+    def sse_iter():
+        # Retrieval metadata first so the client can render sources early
+        yield "event: chunks\ndata: " + json.dumps({
+            "retrieved_chunks": search_results,
+            "total_chunks_indexed": total_chunks
+        }) + "\n\n"
+
+        for token in generator.stream_answer(
+            query=request.query,
+            context_chunks=[r["chunk"] for r in search_results],
+            model_name=request.model_name,
+            max_tokens=2048,
+            temperature=request.temperature
+        ):
+            yield "data: " + json.dumps({"token": token}) + "\n\n"
+
+        yield "event: done\ndata: " + json.dumps({
+            "latency": time.time() - start_time
+        }) + "\n\n"
+
+    return StreamingResponse(
+        sse_iter(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 # ------------------------------
 # Run RAG Experiments
@@ -151,10 +398,12 @@ async def run_experiment(request: RAGExperimentRequest):
         if doc_id not in docs_store:
             raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
 
-    results = []
+    # Run all chunk-size configs concurrently; each uses its own cached
+    # retriever, and the semaphore bounds concurrent LLM calls
+    semaphore = asyncio.Semaphore(EXPERIMENT_CONCURRENCY)
 
-    for chunk_size in request.chunk_sizes:
-        try:
+    async def run_one(chunk_size: int):
+        async with semaphore:
             rag_request = RAGRequest(
                 query=request.query,
                 doc_ids=request.doc_ids,
@@ -163,18 +412,24 @@ async def run_experiment(request: RAGExperimentRequest):
                 top_k=request.top_k,
                 model_name=request.model_name  # Use the model from experiment request
             )
+            return await run_rag(rag_request)
 
-            result = await run_rag(rag_request)
+    raw_results = await asyncio.gather(
+        *[run_one(size) for size in request.chunk_sizes],
+        return_exceptions=True
+    )
 
+    results = []
+    for chunk_size, result in zip(request.chunk_sizes, raw_results):
+        if isinstance(result, Exception):
             results.append({
                 "chunk_size": chunk_size,
-                "result": result
+                "error": str(result)
             })
-
-        except Exception as e:
+        else:
             results.append({
                 "chunk_size": chunk_size,
-                "error": str(e)
+                "result": result
             })
 
     return {
@@ -190,12 +445,26 @@ async def run_experiment(request: RAGExperimentRequest):
 
 @router.get("/retriever-stats")
 def get_retriever_stats():
-    retriever = get_retriever()
-    return retriever.get_stats()
+    # Aggregate stats over all cached per-config indexes
+    stats = get_retriever().get_stats()
+    stats["total_chunks"] += sum(
+        entry["total_chunks"] for entry in INDEX_CACHE.values()
+    )
+    if stats["embedding_dim"] is None:
+        for entry in INDEX_CACHE.values():
+            if entry["retriever"].dimension is not None:
+                stats["embedding_dim"] = entry["retriever"].dimension
+                break
+    stats["has_data"] = stats["total_chunks"] > 0
+    stats["cached_indexes"] = len(INDEX_CACHE)
+    return stats
 
 
 @router.post("/clear-index")
 def clear_index():
     retriever = get_retriever()
     retriever.clear()
+    CHUNK_CACHE.clear()
+    INDEX_CACHE.clear()
+    get_query_cache().clear()
     return {"message": "Index cleared successfully"}
@@ -1,36 +1,76 @@
 # backend/routes/upload.py
+import hashlib
 import os
 import uuid
 from typing import Dict, Any, List
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pdfplumber
 from docx import Document as DocxDocument
 import mimetypes
 
+from services.doc_store import DocStore
+
 router = APIRouter()
 
 # Storage
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# In-memory document store
-docs: Dict[str, Dict[str, Any]] = {}
+# SQLite-backed document store (metadata in SQLite, text on disk) so
+# documents survive reloads and text is only loaded on access
+docs = DocStore()
 
 # Thread pool for blocking operations
 thread_pool = ThreadPoolExecutor(max_workers=4)
 
+# Process pool for CPU-heavy per-page PDF extraction (created on first use);
+# small PDFs stay serial to avoid the pool round-trip overhead
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+_process_pool: ProcessPoolExecutor = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _process_pool
+
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) — each worker opens its own handle"""
+    texts = []
+    with pdfplumber.open(file_path) as pdf:
+        for i in range(start, end):
+            texts.append(pdf.pages[i].extract_text() or "")
+    return texts
+
 
 def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF using pdfplumber"""
+    """Extract text from PDF using pdfplumber, parallelizing across pages"""
     texts = []
     try:
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                texts.append(page_text)
+            num_pages = len(pdf.pages)
+
+            if num_pages < PDF_PARALLEL_MIN_PAGES:
+                for page in pdf.pages:
+                    page_text = page.extract_text() or ""
+                    texts.append(page_text)
+                return "\n".join(texts)
+
+        # Large PDF: split the page range across worker processes
+        pool = _get_process_pool()
+        workers = pool._max_workers
+        step = -(-num_pages // workers)  # ceil division
+        futures = [
+            pool.submit(_extract_pdf_page_range, file_path, start, min(start + step, num_pages))
+            for start in range(0, num_pages, step)
+        ]
+        for future in futures:
+            texts.extend(future.result())
         return "\n".join(texts)
     except Exception as e:
         print(f"PDF extraction error: {e}")
@@ -89,11 +129,11 @@ async def upload_docs(file: UploadFile = File(...)):
     doc_id = str(uuid.uuid4())
     dest_path = os.path.join(UPLOAD_DIR, f"{doc_id}{file_ext}")
     
-    # Save file
+    # Stream to disk in 1MB blocks so large files never sit fully in RAM
     try:
-        contents = await file.read()
         with open(dest_path, "wb") as f:
-            f.write(contents)
+            while chunk := await file.read(1 << 20):
+                f.write(chunk)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
@@ -129,22 +169,25 @@ async def upload_docs(file: UploadFile = File(...)):
             }
         )
     
-    # Store document
+    # Store document (split once for the word count)
+    word_count = len(text.split())
     docs[doc_id] = {
         "filename": file.filename,
         "path": dest_path,
         "text": text,
         "file_type": file_ext,
         "text_length": len(text),
-        "word_count": len(text.split()),
+        "word_count": word_count,
+        # Content hash so downstream chunk/index caches invalidate on edits
+        "text_hash": hashlib.sha1(text.encode("utf-8")).hexdigest(),
         "status": "processed"
     }
-    
+
     return {
         "doc_id": doc_id,
         "filename": file.filename,
         "text_length": len(text),
-        "word_count": len(text.split()),
+        "word_count": word_count,
         "status": "processed"
     }
 
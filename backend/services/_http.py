@@ -0,0 +1,35 @@
+# backend/services/_http.py
+"""
+Process-wide HTTP connection pools for the LLM clients.
+
+Every Groq client (generator + evaluator, sync + async) hands its requests to
+one of these two httpx clients, so connections are kept alive across calls —
+no per-request TCP/TLS handshake — and concurrent fan-out (batch evaluate,
+experiments) multiplexes onto a bounded socket pool instead of opening one
+connection per in-flight call. HTTP/2 is enabled when the optional h2 package
+is installed.
+"""
+import httpx
+
+_LIMITS = httpx.Limits(max_connections=128, max_keepalive_connections=64)
+_TIMEOUT = httpx.Timeout(60.0)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+_HTTP2 = _http2_available()
+
+sync_client = httpx.Client(http2=_HTTP2, limits=_LIMITS, timeout=_TIMEOUT)
+async_client = httpx.AsyncClient(http2=_HTTP2, limits=_LIMITS, timeout=_TIMEOUT)
+
+
+async def aclose() -> None:
+    """Drain both pools; called from the app shutdown lifespan"""
+    sync_client.close()
+    await async_client.aclose()
@@ -2,6 +2,10 @@
 from typing import List, Dict
 import re
 
+import numpy as np
+
+from services.chunker_numba import word_chunk_bounds, sentence_chunk_bounds
+
 
 def chunk_by_words(text: str, chunk_size: int, overlap: int = 0) -> List[str]:
     """
@@ -15,24 +19,23 @@ def chunk_by_words(text: str, chunk_size: int, overlap: int = 0) -> List[str]:
     Returns:
         List of text chunks
     """
-    words = text.split()
+    # One regex pass for word offsets; each chunk is then a direct substring
+    # of the original text (no per-chunk list slice + join)
+    spans = [(m.start(), m.end()) for m in re.finditer(r'\S+', text)]
     chunks = []
-    
-    if not words:
+
+    if not spans:
         return []
-    
+
     step = chunk_size - overlap
     if step <= 0:
         step = chunk_size  # Fallback if overlap >= chunk_size
-    
-    for i in range(0, len(words), step):
-        chunk = " ".join(words[i : i + chunk_size])
-        chunks.append(chunk)
-        
-        # Stop if we've covered all words
-        if i + chunk_size >= len(words):
-            break
-    
+
+    starts, lasts = word_chunk_bounds(len(spans), chunk_size, step)
+
+    for start, last in zip(starts, lasts):
+        chunks.append(text[spans[start][0] : spans[last][1]])
+
     return chunks
 
 
@@ -48,36 +51,27 @@ def chunk_by_sentences(text: str, chunk_size: int, overlap: int = 0) -> List[str
     Returns:
         List of text chunks
     """
-    # Split by sentence boundaries
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    
-    chunks = []
-    current_chunk = []
-    current_word_count = 0
-    
-    for sentence in sentences:
-        sentence_words = len(sentence.split())
-        
-        if current_word_count + sentence_words > chunk_size and current_chunk:
-            # Save current chunk
-            chunks.append(" ".join(current_chunk))
-            
-            # Handle overlap
-            if overlap > 0 and len(current_chunk) > overlap:
-                current_chunk = current_chunk[-overlap:]
-                current_word_count = sum(len(s.split()) for s in current_chunk)
-            else:
-                current_chunk = []
-                current_word_count = 0
-        
-        current_chunk.append(sentence)
-        current_word_count += sentence_words
-    
-    # Add remaining chunk
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-    
-    return chunks
+    # Sentence boundary offsets in one pass; word counts computed once per
+    # sentence so the overlap path doesn't re-split strings
+    boundaries = [0]
+    for m in re.finditer(r'(?<=[.!?])\s+', text):
+        boundaries.append(m.end())
+
+    spans = []
+    word_counts = []
+    for i, start in enumerate(boundaries):
+        end = len(text) if i + 1 == len(boundaries) else boundaries[i + 1]
+        spans.append((start, end))
+        word_counts.append(sum(1 for _ in re.finditer(r'\S+', text[start:end])))
+
+    starts, lasts = sentence_chunk_bounds(
+        np.asarray(word_counts, dtype=np.int64), chunk_size, overlap
+    )
+
+    return [
+        text[spans[start][0] : spans[last][1]].rstrip()
+        for start, last in zip(starts, lasts)
+    ]
 
 
 def chunk_by_tokens_approximation(text: str, chunk_size: int, overlap: int = 0) -> List[str]:
@@ -125,7 +119,7 @@ def create_chunks(
         if method == "sentences":
             chunks = chunk_by_sentences(text, size, overlap)
         elif method == "tokens":
-            chunks = chunk_by_tokens_approximation(size, overlap)
+            chunks = chunk_by_tokens_approximation(text, size, overlap)
         else:  # default to words
             chunks = chunk_by_words(text, size, overlap)
         
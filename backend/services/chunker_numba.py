@@ -0,0 +1,96 @@
+# backend/services/chunker_numba.py
+"""
+Optional Numba-compiled kernels for chunk boundary arithmetic.
+
+The chunkers only need index math (which word/sentence starts and ends each
+chunk) — the string slicing stays in plain Python. When numba is installed
+these kernels compile to native code; otherwise the same functions run as
+pure Python with identical results.
+"""
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+
+
+def _word_chunk_bounds_py(n_words: int, chunk_size: int, step: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Chunk start/last word indices for fixed-size word chunking"""
+    count = 0
+    i = 0
+    while True:
+        count += 1
+        if i + chunk_size >= n_words:
+            break
+        i += step
+
+    starts = np.empty(count, dtype=np.int64)
+    lasts = np.empty(count, dtype=np.int64)
+    i = 0
+    for k in range(count):
+        starts[k] = i
+        last = i + chunk_size
+        if last > n_words:
+            last = n_words
+        lasts[k] = last - 1
+        i += step
+
+    return starts, lasts
+
+
+def _sentence_chunk_bounds_py(
+    word_counts: np.ndarray,
+    chunk_size: int,
+    overlap: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Chunk start/last sentence indices for sentence accumulation chunking"""
+    n = word_counts.shape[0]
+    starts = np.empty(n + 1, dtype=np.int64)
+    lasts = np.empty(n + 1, dtype=np.int64)
+    count = 0
+
+    chunk_start = 0
+    current = 0
+
+    for i in range(n):
+        if current + word_counts[i] > chunk_size and i > chunk_start:
+            starts[count] = chunk_start
+            lasts[count] = i - 1
+            count += 1
+
+            if overlap > 0 and i - chunk_start > overlap:
+                chunk_start = i - overlap
+                current = 0
+                for j in range(chunk_start, i):
+                    current += word_counts[j]
+            else:
+                chunk_start = i
+                current = 0
+
+        current += word_counts[i]
+
+    if chunk_start < n:
+        starts[count] = chunk_start
+        lasts[count] = n - 1
+        count += 1
+
+    return starts[:count], lasts[:count]
+
+
+if NUMBA_AVAILABLE:
+    word_chunk_bounds = njit(cache=True)(_word_chunk_bounds_py)
+    sentence_chunk_bounds = njit(cache=True)(_sentence_chunk_bounds_py)
+else:
+    word_chunk_bounds = _word_chunk_bounds_py
+    sentence_chunk_bounds = _sentence_chunk_bounds_py
+
+
+def warmup() -> None:
+    """Trigger JIT compilation at startup so the first request doesn't stall"""
+    word_chunk_bounds(10, 4, 3)
+    sentence_chunk_bounds(np.array([3, 4, 5], dtype=np.int64), 8, 1)
@@ -0,0 +1,178 @@
+# backend/services/doc_store.py
+import mmap
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Storage locations (overridable via environment)
+DOC_DB_PATH = os.getenv("DOC_DB_PATH", "data/docs.db")
+DOC_TEXT_DIR = os.getenv("DOC_TEXT_DIR", "data/uploads")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id      TEXT PRIMARY KEY,
+    filename    TEXT,
+    file_type   TEXT,
+    path        TEXT,
+    text_path   TEXT,
+    text_length INTEGER DEFAULT 0,
+    word_count  INTEGER DEFAULT 0,
+    text_hash   TEXT,
+    status      TEXT,
+    note        TEXT
+)
+"""
+
+_COLUMNS = (
+    "doc_id", "filename", "file_type", "path", "text_path",
+    "text_length", "word_count", "text_hash", "status", "note"
+)
+
+
+class LazyDoc:
+    """
+    Dict-like view of one document row.
+
+    Metadata comes straight from the SQLite row; the full extracted text is
+    only read from disk the first time "text" is accessed, so listing and
+    validating documents never loads document bodies into memory.
+    """
+
+    def __init__(self, store: "DocStore", row: Dict[str, Any]):
+        self._store = store
+        self._data = dict(row)
+
+    def _load_text(self) -> str:
+        if "text" not in self._data:
+            self._data["text"] = self._store.read_text(self._data.get("text_path"))
+        return self._data["text"]
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "text":
+            return self._load_text()
+        return self._data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        # In-memory only; persistent fields are written via DocStore
+        self._data[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key == "text" or key in self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "text":
+            return self._load_text()
+        return self._data.get(key, default)
+
+
+class DocStore:
+    """
+    SQLite-backed document store.
+
+    Metadata lives in a small WAL-mode SQLite table; extracted text is
+    written to data/uploads/{doc_id}.txt and loaded lazily on access.
+    Documents survive process restarts and the resident memory cost is
+    one row of metadata per document, not the full decoded text.
+    """
+
+    def __init__(self, db_path: str = DOC_DB_PATH, text_dir: str = DOC_TEXT_DIR):
+        self.db_path = db_path
+        self.text_dir = text_dir
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        os.makedirs(text_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _text_path(self, doc_id: str) -> str:
+        return os.path.join(self.text_dir, f"{doc_id}.txt")
+
+    @staticmethod
+    def read_text(text_path: Optional[str]) -> str:
+        """
+        Read extracted text back from disk ('' when never extracted).
+
+        The file is memory-mapped rather than read through a buffered file
+        object: the OS page cache backs the bytes, so concurrent requests
+        for the same document share pages instead of each paying a full
+        read, and the decoded string is released with its LazyDoc.
+        """
+        if not text_path or not os.path.exists(text_path):
+            return ""
+        with open(text_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:].decode("utf-8")
+
+    # --------------------------------------
+    # Dict-style interface used by the routes
+    # --------------------------------------
+
+    def __setitem__(self, doc_id: str, record: Dict[str, Any]) -> None:
+        text = record.get("text", "")
+        text_path = None
+        if text:
+            text_path = self._text_path(doc_id)
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+        row = (
+            doc_id,
+            record.get("filename"),
+            record.get("file_type"),
+            record.get("path"),
+            text_path,
+            record.get("text_length", 0),
+            record.get("word_count", 0),
+            record.get("text_hash"),
+            record.get("status"),
+            record.get("note")
+        )
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO docs ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                row
+            )
+
+    def __getitem__(self, doc_id: str) -> LazyDoc:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM docs WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return LazyDoc(self, dict(row))
+
+    def __delitem__(self, doc_id: str) -> None:
+        doc = self[doc_id]
+        text_path = doc.get("text_path")
+        if text_path and os.path.exists(text_path):
+            os.remove(text_path)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM docs WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, LazyDoc]]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM docs").fetchall()
+        for row in rows:
+            yield row["doc_id"], LazyDoc(self, dict(row))
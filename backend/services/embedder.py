@@ -1,96 +1,315 @@
 # backend/services/embedder.py
+import asyncio
+import hashlib
 import os
+from collections import OrderedDict
 from typing import List, Dict
 import threading
 
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
 # --------------------------
 # Configuration
 # --------------------------
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 # For embeddings, we use SentenceTransformers since Groq doesn't provide embedding API
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CACHE_MAX = int(os.getenv("EMBEDDING_CACHE_MAX", "50000"))
+# On CPU, an ONNX Runtime export of the same model is typically 2-4x faster
+# than the PyTorch path; set to "0" to force plain SentenceTransformer
+EMBEDDING_USE_ONNX = os.getenv("EMBEDDING_USE_ONNX", "1") == "1"
+# Intra-op threads for the CPU transformer matmuls; torch often defaults to a
+# single thread in containers, leaving the other cores idle. Past ~8 threads
+# cache bandwidth dominates, so cap there by default.
+EMBEDDER_CPU_THREADS = int(
+    os.getenv("EMBEDDER_CPU_THREADS", str(min(8, os.cpu_count() or 1)))
+)
+# Persistent embedding cache (optional diskcache dependency): shared by all
+# service instances in the process and survives restarts, so re-indexing the
+# same corpus after a deploy never re-embeds. Keys are model-scoped digests;
+# values are packed float32 bytes (~1.5 KB/vector for 384-d).
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "data/embeddings")
+EMBED_CACHE_SIZE_LIMIT = int(os.getenv("EMBED_CACHE_SIZE_LIMIT", str(2 << 30)))
+
+_disk_cache = None
+if diskcache is not None and EMBED_CACHE_DIR:
+    try:
+        _disk_cache = diskcache.Cache(EMBED_CACHE_DIR, size_limit=EMBED_CACHE_SIZE_LIMIT)
+    except Exception as e:
+        print(f"⚠ Disk embedding cache unavailable at '{EMBED_CACHE_DIR}': {e}")
+        _disk_cache = None
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "256"))
 
 _lock = threading.Lock()
 
 
 class EmbeddingService:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, batch_size: int = None):
         self.model = model_name or EMBEDDING_MODEL
-        self.cache: Dict[str, List[float]] = {}
-
-        # Load SentenceTransformer model
-        try:
-            self._st_model = SentenceTransformer(self.model)
-            print(f"✓ Loaded embedding model: {self.model}")
-        except Exception as e:
-            raise RuntimeError(
-                f"Failed to load SentenceTransformer model '{self.model}'. "
-                f"Error: {e}\n"
-                f"Make sure sentence-transformers is installed: pip install sentence-transformers"
-            )
+        self.batch_size = batch_size or EMBEDDING_BATCH_SIZE
+        # LRU-capped embedding cache, keyed by content digest; values are
+        # packed float32 arrays (~8x smaller than boxed Python floats)
+        self.cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.max_cache = EMBEDDING_CACHE_MAX
+        self._cache_lock = threading.Lock()
+        # Pre-encoded key prefix so per-call key building is one bytes
+        # concat + digest, with no f-string formatting on the hot path
+        self._key_prefix = f"{self.model}\0".encode("utf-8")
+
+        # On CPU, prefer an ONNX Runtime export of the model (optimum is an
+        # optional dependency; any failure falls through to plain ST)
+        self._ort_model = None
+        self._tokenizer = None
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        if device == "cpu" and EMBEDDER_CPU_THREADS > 0:
+            torch.set_num_threads(EMBEDDER_CPU_THREADS)
+            try:
+                torch.set_num_interop_threads(max(1, EMBEDDER_CPU_THREADS // 4))
+            except RuntimeError:
+                # Interop pool already started (e.g. re-init in the same
+                # process); intra-op threads above are the setting that matters
+                pass
+        if EMBEDDING_USE_ONNX and device == "cpu":
+            try:
+                from optimum.onnxruntime import ORTModelForFeatureExtraction
+                from transformers import AutoTokenizer
+
+                model_id = (
+                    self.model if "/" in self.model
+                    else f"sentence-transformers/{self.model}"
+                )
+                self._ort_model = ORTModelForFeatureExtraction.from_pretrained(
+                    model_id, export=True, provider="CPUExecutionProvider"
+                )
+                self._tokenizer = AutoTokenizer.from_pretrained(model_id)
+                print(f"✓ Loaded embedding model: {model_id} via ONNX Runtime (cpu)")
+            except Exception as e:
+                print(f"ONNX Runtime unavailable for '{self.model}' ({e}); "
+                      f"falling back to SentenceTransformer")
+                self._ort_model = None
+                self._tokenizer = None
+
+        # Load SentenceTransformer model (GPU when available — ST defaults to CPU)
+        self._st_model = None
+        if self._ort_model is None:
+            try:
+                self._st_model = SentenceTransformer(self.model, device=device)
+                print(f"✓ Loaded embedding model: {self.model} on {device}")
+            except Exception as e:
+                raise RuntimeError(
+                    f"Failed to load SentenceTransformer model '{self.model}'. "
+                    f"Error: {e}\n"
+                    f"Make sure sentence-transformers is installed: pip install sentence-transformers"
+                )
 
     # --------------------------------------
     # SentenceTransformer Embedding
     # --------------------------------------
-    def _st_embed(self, texts: List[str]) -> List[List[float]]:
-        vecs = self._st_model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-        out = []
-        for v in vecs:
-            n = np.linalg.norm(v)
-            out.append((v / n).tolist() if n > 0 else v.tolist())
+    def _ort_embed(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        # Tokenize → ORT forward → mean-pool over the attention mask →
+        # L2-normalize, matching what ST's encode(normalize_embeddings=True)
+        # produces for the same checkpoint
+        bs = batch_size or self.batch_size
+        rows = []
+        for i in range(0, len(texts), bs):
+            batch = self._tokenizer(
+                texts[i:i + bs],
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_SEQ_LENGTH,
+                return_tensors="pt"
+            )
+            with torch.no_grad():
+                hidden = self._ort_model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).float()
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            rows.append(pooled.numpy())
+        out = np.concatenate(rows).astype(np.float32, copy=False)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
         return out
 
+    def _st_embed(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        if self._ort_model is not None:
+            return self._ort_embed(texts, batch_size=batch_size)
+        # normalize_embeddings=True does the L2 normalization on the torch
+        # side in one fused op, so no Python post-processing is needed
+        vecs = self._st_model.encode(
+            texts,
+            batch_size=batch_size or self.batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        return np.asarray(vecs, dtype=np.float32)
+
     # --------------------------------------
     # Single Text Embedding
     # --------------------------------------
-    def embed_text(self, text: str) -> List[float]:
-        key = f"{self.model}:{text[:200]}"
+    def _cache_key(self, text: str) -> bytes:
+        # Digest of the full text — the old 200-char prefix key collided for
+        # distinct texts sharing a prefix and returned the wrong embedding
+        return hashlib.blake2b(
+            self._key_prefix + text.encode("utf-8"), digest_size=16
+        ).digest()
+
+    @staticmethod
+    def _disk_get(key: bytes) -> "np.ndarray | None":
+        if _disk_cache is None:
+            return None
+        packed = _disk_cache.get(key)
+        if packed is None:
+            return None
+        return np.frombuffer(packed, dtype=np.float32)
 
-        if key in self.cache:
-            return self.cache[key]
+    @staticmethod
+    def _disk_put(key: bytes, arr: np.ndarray) -> None:
+        if _disk_cache is not None:
+            _disk_cache.set(key, arr.tobytes())
+
+    def embed_text(self, text: str) -> List[float]:
+        key = self._cache_key(text)
 
-        # Get embedding from SentenceTransformer
-        vec = self._st_embed([text])[0]
+        with self._cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key].tolist()
 
-        arr = np.array(vec, dtype=float)
-        n = np.linalg.norm(arr)
-        arr = arr / n if n > 0 else arr
+        # Second-level persistent cache (no model pass on a warm disk)
+        arr = self._disk_get(key)
+        if arr is None:
+            # _st_embed returns already-normalized float32 rows
+            arr = self._st_embed([text])[0]
+            self._disk_put(key, arr)
 
-        vec = arr.tolist()
-        self.cache[key] = vec
-        return vec
+        with self._cache_lock:
+            self.cache[key] = arr
+            if len(self.cache) > self.max_cache:
+                self.cache.popitem(last=False)
+        return arr.tolist()
 
     # --------------------------------------
     # Batch Embeddings
     # --------------------------------------
-    def embed_batch(self, texts: List[str], batch_size: int = 100) -> List[List[float]]:
-        out = []
+    def embed_batch(self, texts: List[str], batch_size: int = None) -> List[List[float]]:
+        if not texts:
+            return []
 
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i : i + batch_size]
-            emb = self._st_embed(batch)
+        # Deduplicate first: ingest pipelines routinely resubmit identical
+        # chunks (boilerplate headers/footers), and each duplicate would
+        # otherwise cost a full model pass
+        positions: "Dict[str, List[int]]" = {}
+        for i, t in enumerate(texts):
+            positions.setdefault(t, []).append(i)
 
-            for v in emb:
-                arr = np.array(v, dtype=float)
-                n = np.linalg.norm(arr)
-                out.append((arr / n).tolist() if n > 0 else arr.tolist())
+        out: List[np.ndarray] = [None] * len(texts)
 
-        return out
+        # Serve cached texts without touching the model
+        misses: List[str] = []
+        miss_keys: List[bytes] = []
+        with self._cache_lock:
+            for text in positions:
+                key = self._cache_key(text)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.cache.move_to_end(key)
+                    for p in positions[text]:
+                        out[p] = cached
+                else:
+                    misses.append(text)
+                    miss_keys.append(key)
+
+        # Second-level persistent cache (outside the lock — disk I/O)
+        to_embed: List[str] = []
+        keys: List[bytes] = []
+        for text, key in zip(misses, miss_keys):
+            arr = self._disk_get(key)
+            if arr is not None:
+                for p in positions[text]:
+                    out[p] = arr
+                with self._cache_lock:
+                    self.cache[key] = arr
+                    if len(self.cache) > self.max_cache:
+                        self.cache.popitem(last=False)
+            else:
+                to_embed.append(text)
+                keys.append(key)
+
+        if to_embed:
+            # Smart batching: sort by length so each model batch pads to
+            # similar-sized inputs instead of the longest outlier, then
+            # scatter the results back into the caller's order
+            order = np.argsort([len(t) for t in to_embed], kind="stable")
+            sorted_out = self._st_embed([to_embed[i] for i in order], batch_size=batch_size)
+
+            embedded = np.empty_like(sorted_out)
+            embedded[order] = sorted_out
+
+            with self._cache_lock:
+                for text, key, row in zip(to_embed, keys, embedded):
+                    for p in positions[text]:
+                        out[p] = row
+                    self.cache[key] = row
+                    if len(self.cache) > self.max_cache:
+                        self.cache.popitem(last=False)
+            for key, row in zip(keys, embedded):
+                self._disk_put(key, row)
+
+        return [row.tolist() for row in out]
+
+    async def embed_batch_async(self, texts: List[str], batch_size: int = None) -> List[List[float]]:
+        """
+        Async twin of embed_batch: offloads the CPU-bound encode to a worker
+        thread so async request handlers don't block the event loop on it
+        """
+        return await asyncio.to_thread(self.embed_batch, texts, batch_size)
 
     def embed_query(self, query: str) -> List[float]:
         return self.embed_text(query)
 
+    async def embed_query_async(self, query: str) -> List[float]:
+        """Async twin of embed_query (see embed_batch_async)"""
+        return await asyncio.to_thread(self.embed_query, query)
+
     @staticmethod
-    def cosine_similarity(v1: List[float], v2: List[float]) -> float:
-        a = np.array(v1, dtype=float)
-        b = np.array(v2, dtype=float)
+    def cosine_similarity(v1, v2) -> float:
+        # asarray is a no-op for float32 ndarrays, so pre-normalized cached
+        # vectors pass through without a copy
+        #
+        # Note: everything this service produces is already L2-normalized, so
+        # the norm computation here is redundant for our own vectors. Prefer
+        # cosine_similarity_normalized / cosine_sim_many for those; this stays
+        # for callers with vectors of unknown scale.
+        a = np.asarray(v1, dtype=np.float32)
+        b = np.asarray(v2, dtype=np.float32)
         na = np.linalg.norm(a)
         nb = np.linalg.norm(b)
         return float(np.dot(a, b) / (na * nb)) if na > 0 and nb > 0 else 0.0
 
+    @staticmethod
+    def cosine_similarity_normalized(v1, v2) -> float:
+        """Cosine of two already L2-normalized vectors: just the dot product"""
+        a = np.asarray(v1, dtype=np.float32)
+        b = np.asarray(v2, dtype=np.float32)
+        return float(np.dot(a, b))
+
+    @staticmethod
+    def cosine_sim_many(query: np.ndarray, bank: np.ndarray) -> np.ndarray:
+        """
+        Cosine scores of one normalized query against a pre-stacked (N, D)
+        normalized float32 matrix — a single BLAS matvec instead of N
+        per-vector norm + dot calls
+        """
+        return bank @ query
+
 
 # GLOBAL SINGLETON
 _embedder = None
@@ -99,7 +318,26 @@ _embedder_lock = threading.Lock()
 
 def get_embedder(model_name: str = None) -> EmbeddingService:
     global _embedder
+    # Double-checked locking: after init, return without touching the mutex
+    # (the GIL makes the pointer read/assignment atomic), so per-query callers
+    # never serialize on it
+    embedder = _embedder
+    if embedder is not None:
+        return embedder
     with _embedder_lock:
         if _embedder is None:
             _embedder = EmbeddingService(model_name=model_name)
         return _embedder
+
+
+def init_embedder(model_name: str = None) -> EmbeddingService:
+    """
+    Build the singleton and run a one-sentence warmup embed so the first
+    real request doesn't pay model load + first-pass kernel cost
+    """
+    embedder = get_embedder(model_name=model_name)
+    try:
+        embedder._st_embed(["warmup"])
+    except Exception:
+        pass
+    return embedder
@@ -1,5 +1,11 @@
 # backend/services/generator.py
+import asyncio
+import hashlib
 import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 
@@ -7,25 +13,118 @@ from dotenv import load_dotenv
 load_dotenv()
 
 try:
-    from groq import Groq
+    from groq import Groq, AsyncGroq
 except ImportError:
     Groq = None
+    AsyncGroq = None
+
+try:
+    from services import _http
+except ImportError:  # httpx missing alongside groq
+    _http = None
 
 # Configure Groq API
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 
+# Q/A pairs from generate_test_questions, extracted in one multiline scan:
+# a Q line, its (possibly multi-line) A, up to the next Q or end of text
+_QA_RE = re.compile(
+    r'^\s*Q\d*\s*[:.]\s*(.+?)\s*^\s*A\d*\s*[:.]\s*(.+?)(?=^\s*Q\d*\s*[:.]|\Z)',
+    re.MULTILINE | re.DOTALL
+)
+
+# All invariant RAG instructions live in the system message, byte-identical
+# on every call, so providers that cache shared prompt prefixes only process
+# the per-request context+question at full price
+RAG_SYSTEM_PROMPT = """You are a helpful assistant that answers questions based on provided context.
+
+INSTRUCTIONS:
+- Answer the question using ONLY the information provided in the context
+- If the context doesn't contain enough information to answer, say so
+- Be concise and accurate
+- Always cite which context chunks you used (e.g., [1], [2])"""
+
+# Fused generate+self-evaluate variant: same rubric suffix every call
+RAG_SELF_EVAL_SYSTEM_PROMPT = RAG_SYSTEM_PROMPT + """
+
+After your answer, evaluate it yourself against the context. Append a section in exactly this format:
+
+SELF-EVALUATION:
+RELEVANCE: [score]/100
+ACCURACY: [score]/100
+COMPLETENESS: [score]/100
+COHERENCE: [score]/100
+FAITHFULNESS: [score]/100
+OVERALL: [average score]/100"""
+
+
+# One process-wide Groq client on the shared pooled transport: the model is
+# just a per-call string, so per-model generator instances don't each rebuild
+# a client (and its TLS context)
+_GROQ = (
+    Groq(api_key=GROQ_API_KEY, http_client=_http.sync_client if _http else None)
+    if Groq and GROQ_API_KEY else None
+)
+_AGROQ = (
+    AsyncGroq(api_key=GROQ_API_KEY, http_client=_http.async_client if _http else None)
+    if AsyncGroq and GROQ_API_KEY else None
+)
+
+# Bound on concurrent generations in generate_answers_batch (rate limits)
+GENERATE_CONCURRENCY = int(os.getenv("GENERATE_CONCURRENCY", "16"))
+
+# LRU cap for the exact-match answer cache. Semantic near-miss matching
+# already happens at the route layer (SemanticQueryCache); this layer catches
+# byte-identical (prompt, model, params) repeats from sweeps and comparisons
+# that bypass the route cache.
+GENERATOR_CACHE_MAX = int(os.getenv("GENERATOR_CACHE_MAX", "512"))
+
+
+@lru_cache(maxsize=256)
+def _format_ctx(ctx: tuple) -> str:
+    """
+    Numbered context block, memoized by content: sweeps reuse the same
+    retrieved chunks across many generations, and each reuse previously
+    re-formatted every chunk
+    """
+    return "\n\n".join(f"[{i+1}] {chunk}" for i, chunk in enumerate(ctx))
+
 
 class LLMGenerator:
     """Service for generating answers using Groq API"""
-    
+
     def __init__(self, model_name: str = "llama-3.1-8b-instant"):
         self.model_name = model_name
-        if Groq and GROQ_API_KEY:
-            self.client = Groq(api_key=GROQ_API_KEY)
+        self.client = _GROQ
+        self.aclient = _AGROQ
+        # LRU answer cache keyed by a digest of (model, prompt, params)
+        self._response_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        if self.client:
             print(f"✓ Groq client initialized with model: {model_name}")
         else:
-            self.client = None
             print("⚠ Groq client not initialized - check GROQ_API_KEY in .env file")
+
+    @staticmethod
+    def _response_key(model: str, prompt: str, max_tokens: int, temperature: float) -> bytes:
+        return hashlib.blake2b(
+            f"{model}\0{max_tokens}\0{temperature}\0{prompt}".encode("utf-8"),
+            digest_size=16
+        ).digest()
+
+    def _response_cache_get(self, key: bytes) -> "Dict[str, Any] | None":
+        with self._cache_lock:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                self._response_cache.move_to_end(key)
+                return dict(cached)
+        return None
+
+    def _response_cache_put(self, key: bytes, result: Dict[str, Any]) -> None:
+        with self._cache_lock:
+            self._response_cache[key] = dict(result)
+            if len(self._response_cache) > GENERATOR_CACHE_MAX:
+                self._response_cache.popitem(last=False)
     
     def generate_answer(
         self, 
@@ -52,11 +151,16 @@ class LLMGenerator:
         model_to_use = model_name or self.model_name
         
         # Build context
-        context = "\n\n".join([f"[{i+1}] {chunk}" for i, chunk in enumerate(context_chunks)])
+        context = _format_ctx(tuple(context_chunks))
         
         # Build prompt
         prompt = self._build_rag_prompt(query, context)
-        
+
+        key = self._response_key(model_to_use, prompt, max_tokens, temperature)
+        cached = self._response_cache_get(key)
+        if cached is not None:
+            return cached
+
         # Generate response
         if self.client:
             try:
@@ -64,7 +168,7 @@ class LLMGenerator:
                     messages=[
                         {
                             "role": "system",
-                            "content": "You are a helpful assistant that answers questions based on provided context. Always cite your sources using [1], [2], etc."
+                            "content": RAG_SYSTEM_PROMPT
                         },
                         {
                             "role": "user",
@@ -85,36 +189,265 @@ class LLMGenerator:
                     "total_tokens": chat_completion.usage.total_tokens
                 }
                 
-                return {
+                result = {
                     "answer": answer,
                     "model": model_to_use,
                     "usage": usage,
                     "context_used": len(context_chunks)
                 }
-            
+                self._response_cache_put(key, result)
+                return result
+
             except Exception as e:
                 print(f"Generation error: {e}")
                 return self._fallback_answer(query, context_chunks)
         else:
             return self._fallback_answer(query, context_chunks)
     
-    def _build_rag_prompt(self, query: str, context: str) -> str:
-        """Build RAG prompt template"""
-        return f"""You are a helpful assistant that answers questions based on provided context.
+    async def agenerate_answer(
+        self,
+        query: str,
+        context_chunks: List[str],
+        model_name: str = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7
+    ) -> Dict[str, Any]:
+        """Async twin of generate_answer on the shared AsyncGroq client"""
+        model_to_use = model_name or self.model_name
 
-CONTEXT:
-{context}
+        if not self.aclient:
+            return self._fallback_answer(query, context_chunks)
 
-QUESTION:
-{query}
+        context = _format_ctx(tuple(context_chunks))
+        prompt = self._build_rag_prompt(query, context)
 
-INSTRUCTIONS:
-- Answer the question using ONLY the information provided in the context above
-- If the context doesn't contain enough information to answer, say so
-- Be concise and accurate
-- Cite which context chunks you used (e.g., [1], [2])
+        key = self._response_key(model_to_use, prompt, max_tokens, temperature)
+        cached = self._response_cache_get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            chat_completion = await self.aclient.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": RAG_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                model=model_to_use,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+
+            usage = {
+                "prompt_tokens": chat_completion.usage.prompt_tokens,
+                "completion_tokens": chat_completion.usage.completion_tokens,
+                "total_tokens": chat_completion.usage.total_tokens
+            }
+
+            result = {
+                "answer": chat_completion.choices[0].message.content,
+                "model": model_to_use,
+                "usage": usage,
+                "context_used": len(context_chunks)
+            }
+            self._response_cache_put(key, result)
+            return result
+
+        except Exception as e:
+            print(f"Generation error: {e}")
+            return self._fallback_answer(query, context_chunks)
+
+    async def generate_answers_batch(
+        self,
+        queries: List[str],
+        contexts: List[List[str]],
+        model_name: str = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate answers for many (query, context) pairs concurrently.
+
+        Sweeps previously paid one full round-trip per pair in sequence;
+        gathering on the shared async client collapses wall time to roughly
+        the slowest call, bounded by GENERATE_CONCURRENCY.
+
+        Dispatch is prefix-clustered: pairs sharing the same retrieved
+        context go out back-to-back, so the provider's prompt-prefix cache
+        sees consecutive hits instead of interleaved unrelated prefixes.
+        Results are returned in input order regardless.
+        """
+        semaphore = asyncio.Semaphore(GENERATE_CONCURRENCY)
+        results: List[Dict[str, Any]] = [None] * len(queries)
+
+        async def generate_one(i: int) -> None:
+            async with semaphore:
+                results[i] = await self.agenerate_answer(
+                    queries[i],
+                    contexts[i],
+                    model_name=model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+
+        order = sorted(
+            range(len(queries)),
+            key=lambda i: hashlib.blake2b(
+                _format_ctx(tuple(contexts[i]))[:512].encode("utf-8"),
+                digest_size=8
+            ).digest()
+        )
+        await asyncio.gather(*[generate_one(i) for i in order])
+        return results
+
+    def stream_answer(
+        self,
+        query: str,
+        context_chunks: List[str],
+        model_name: str = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7
+    ):
+        """
+        Generate an answer as an incremental token stream
+
+        Yields:
+            Answer text fragments as they arrive from the model
+        """
+        model_to_use = model_name or self.model_name
+
+        if not self.client:
+            yield self._fallback_answer(query, context_chunks)["answer"]
+            return
 
-ANSWER:"""
+        context = _format_ctx(tuple(context_chunks))
+        prompt = self._build_rag_prompt(query, context)
+
+        try:
+            stream = self.client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": RAG_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                model=model_to_use,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except Exception as e:
+            print(f"Generation error: {e}")
+            yield self._fallback_answer(query, context_chunks)["answer"]
+
+    def generate_and_evaluate(
+        self,
+        query: str,
+        context_chunks: List[str],
+        model_name: str = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7
+    ) -> Dict[str, Any]:
+        """
+        Generate an answer AND self-evaluate it in one completion.
+
+        When the judge model equals the generator model, running generation
+        and evaluation separately costs two round-trips and re-sends the
+        context twice. This fuses both into a single prompt; the SCORE block
+        is parsed with the evaluator's pattern. Trades some judging
+        independence for half the RTTs/tokens — opt in where that's fine
+        (e.g. quick sweeps).
+
+        Returns:
+            generate_answer-style dict plus a "scores" key
+        """
+        from services.evaluator import _SCORE_RE, _SCORE_KEYS
+
+        model_to_use = model_name or self.model_name
+
+        if not self.client:
+            result = self._fallback_answer(query, context_chunks)
+            result["scores"] = {}
+            return result
+
+        context = _format_ctx(tuple(context_chunks))
+        prompt = self._build_rag_prompt(query, context)
+
+        try:
+            chat_completion = self.client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": RAG_SELF_EVAL_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                model=model_to_use,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+
+            text = chat_completion.choices[0].message.content
+            answer, _, eval_block = text.partition("SELF-EVALUATION")
+
+            scores = {key: 0.0 for key in _SCORE_KEYS}
+            for metric, value in _SCORE_RE.findall(eval_block):
+                scores[metric.lower()] = float(value)
+            if scores["overall"] == 0.0:
+                scores["overall"] = sum(
+                    scores[key] for key in _SCORE_KEYS if key != "overall"
+                ) / 5.0
+
+            usage = {
+                "prompt_tokens": chat_completion.usage.prompt_tokens,
+                "completion_tokens": chat_completion.usage.completion_tokens,
+                "total_tokens": chat_completion.usage.total_tokens
+            }
+
+            return {
+                "answer": answer.strip(),
+                "scores": scores,
+                "model": model_to_use,
+                "usage": usage,
+                "context_used": len(context_chunks)
+            }
+
+        except Exception as e:
+            print(f"Generation error: {e}")
+            result = self._fallback_answer(query, context_chunks)
+            result["scores"] = {}
+            return result
+
+    # Static fragments of the prompt body, joined per call: no template
+    # re-parsing, and byte-identical framing keeps the cacheable prefix
+    # stable across requests
+    _PROMPT_CONTEXT = "CONTEXT:\n"
+    _PROMPT_QUESTION = "\n\nQUESTION:\n"
+    _PROMPT_ANSWER = "\n\nANSWER:"
+
+    def _build_rag_prompt(self, query: str, context: str) -> str:
+        """Per-request prompt body; the instructions live in RAG_SYSTEM_PROMPT"""
+        return "".join((
+            self._PROMPT_CONTEXT, context,
+            self._PROMPT_QUESTION, query,
+            self._PROMPT_ANSWER
+        ))
     
     def _fallback_answer(self, query: str, context_chunks: List[str]) -> Dict[str, Any]:
         """Generate a simple fallback answer when API is not available"""
@@ -186,27 +519,13 @@ etc.
             )
             
             text = chat_completion.choices[0].message.content
-            
-            # Parse questions and answers
-            questions = []
-            lines = text.split('\n')
-            current_q = None
-            current_a = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Q') and ':' in line:
-                    if current_q and current_a:
-                        questions.append({"question": current_q, "expected_answer": current_a})
-                    current_q = line.split(':', 1)[1].strip()
-                    current_a = None
-                elif line.startswith('A') and ':' in line and current_q:
-                    current_a = line.split(':', 1)[1].strip()
-            
-            # Add last pair
-            if current_q and current_a:
-                questions.append({"question": current_q, "expected_answer": current_a})
-            
+
+            # Parse Q/A pairs in one compiled-regex pass
+            questions = [
+                {"question": q.strip(), "expected_answer": a.strip()}
+                for q, a in _QA_RE.findall(text)
+            ]
+
             return questions[:num_questions]
         
         except Exception as e:
@@ -224,12 +543,9 @@ etc.
         ]
 
 
-# Global generator instance
-_generator = None
-
+# lru_cache is thread-safe at the C level, so a burst of first requests can't
+# race and construct duplicate clients the way the old global-None pattern could
+@lru_cache(maxsize=16)
 def get_generator(model_name: str = "llama-3.1-8b-instant") -> LLMGenerator:
-    """Get or create generator instance"""
-    global _generator
-    if _generator is None:
-        _generator = LLMGenerator(model_name)
-    return _generator
\ No newline at end of file
+    """Get or create the generator instance for a model"""
+    return LLMGenerator(model_name)
\ No newline at end of file
@@ -1,63 +1,258 @@
 # backend/services/retriever.py
+import hashlib
+import os
+import pickle
+import threading
 from typing import List, Dict, Any
 import numpy as np
 import faiss
 from services.embedder import get_embedder
 
+# Optional BM25 prefilter: narrows the candidate set lexically before
+# vector scoring, so huge corpora don't pay a full dim×N scan per query
+try:
+    from rank_bm25 import BM25Okapi
+    BM25_AVAILABLE = True
+except ImportError:
+    BM25_AVAILABLE = False
+
+# Index backend: "flat" is an exact O(N·d) scan; "hnsw" is a graph index
+# with ~log N queries, worth it once corpora grow past a few thousand chunks;
+# "sq8" stores vectors as int8 (per-dim scale), quartering scan bandwidth
+# with <1% recall loss on normalized sentence embeddings
+INDEX_BACKEND = os.getenv("RETRIEVER_INDEX", "flat").lower()
+HNSW_M = int(os.getenv("RETRIEVER_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RETRIEVER_HNSW_EF_CONSTRUCTION", "200"))
+# In "flat" mode, promote to HNSW once the corpus grows past this many
+# chunks: the exhaustive scan becomes the retrieval bottleneck around here,
+# while the graph index keeps >0.95 recall at small top_k. 0 disables.
+HNSW_AUTO_THRESHOLD = int(os.getenv("RETRIEVER_HNSW_AUTO_THRESHOLD", "10000"))
+# Move a flat index to GPU above this many chunks, when a CUDA build of
+# faiss is installed (faiss-gpu) and a device is visible. Batched GPU
+# kernels run the exhaustive scan orders of magnitude faster at this
+# scale. 0 disables.
+GPU_THRESHOLD = int(os.getenv("RETRIEVER_GPU_THRESHOLD", "100000"))
+# BM25 prefilter kicks in above this many chunks (when rank_bm25 is
+# installed): BM25 picks BM25_CANDIDATES lexical candidates and only those
+# are vector-scored, cutting per-query memory bandwidth from O(N·d) to
+# O(N + candidates·d). 0 disables.
+BM25_PREFILTER_THRESHOLD = int(os.getenv("RETRIEVER_BM25_THRESHOLD", "20000"))
+BM25_CANDIDATES = int(os.getenv("RETRIEVER_BM25_CANDIDATES", "200"))
+# When set, the route-layer index cache (one retriever per doc-set/chunking
+# config) is restored from this path prefix at startup and written back at
+# shutdown, so a restart is O(open file) instead of re-embedding every corpus
+RETRIEVER_STATE_PATH = os.getenv("RETRIEVER_STATE_PATH", "")
+
 
 class FAISSRetriever:
     """FAISS-based retriever for fast vector search"""
-    
+
     def __init__(self):
         self.embedder = get_embedder()
         self.index = None
         self.chunks: List[str] = []
         self.metadata: List[Dict[str, Any]] = []
         self.dimension = None
+        # All chunk vectors, L2-normalized, in one contiguous float32 matrix
+        # (geometric growth). Kept alongside the FAISS index so rebuilds and
+        # raw matmul scoring never need re-embedding.
+        self._vectors: np.ndarray = None
+        self._count: int = 0
+        # Set when the index was memory-mapped read-only by load()
+        self._index_readonly: bool = False
+        # Digests of every indexed chunk, so re-uploading the same document
+        # doesn't re-embed and re-index identical chunks
+        self._chunk_hashes: set = set()
+        # BM25 prefilter, built lazily on first search after ingestion so
+        # repeated add calls don't each pay an O(N) rebuild
+        self._bm25 = None
+        # GPU resources must outlive the GPU index they back
+        self._gpu_res = None
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """View of the valid rows of the normalized vector matrix"""
+        if self._vectors is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return self._vectors[:self._count]
+
+    def _append_vectors(self, vecs: np.ndarray) -> None:
+        """Append normalized rows, growing capacity geometrically"""
+        n = vecs.shape[0]
+        if self._vectors is None:
+            capacity = max(1024, n)
+            self._vectors = np.empty((capacity, vecs.shape[1]), dtype=np.float32)
+        while self._count + n > self._vectors.shape[0]:
+            grown = np.empty(
+                (self._vectors.shape[0] * 2, self._vectors.shape[1]), dtype=np.float32
+            )
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+        self._vectors[self._count : self._count + n] = vecs
+        self._count += n
+
+    def _build_index(self, dimension: int) -> "faiss.Index":
+        """Build the configured index type for normalized (inner product) vectors"""
+        if INDEX_BACKEND == "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            return index
+        if INDEX_BACKEND == "sq8":
+            return faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        return faiss.IndexFlatIP(dimension)
     
     def add_documents(
-        self, 
-        chunks: List[str], 
+        self,
+        chunks: List[str],
         doc_id: str = None,
         chunk_size: int = None
     ) -> None:
         """
         Add document chunks to FAISS index
-        
+
         Args:
             chunks: List of text chunks
             doc_id: Document identifier
             chunk_size: Size of chunks used
         """
+        self.add_documents_batch(chunks, [doc_id] * len(chunks), chunk_size=chunk_size)
+
+    def add_documents_batch(
+        self,
+        chunks: List[str],
+        doc_ids: List[str],
+        chunk_size: int = None
+    ) -> None:
+        """
+        Add chunks spanning multiple documents with a single batched embed call
+
+        Args:
+            chunks: List of text chunks (across any number of documents)
+            doc_ids: Parallel list with the source document of each chunk
+            chunk_size: Size of chunks used
+        """
+        if not chunks:
+            return
+
+        # Drop chunks already in the index (re-uploaded documents): each
+        # duplicate skipped saves an embed call and a row in every search
+        fresh_chunks: List[str] = []
+        fresh_doc_ids: List[str] = []
+        seen = self._chunk_hashes
+        for chunk, chunk_doc_id in zip(chunks, doc_ids):
+            digest = hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            fresh_chunks.append(chunk)
+            fresh_doc_ids.append(chunk_doc_id)
+
+        if len(fresh_chunks) < len(chunks):
+            print(f"Skipped {len(chunks) - len(fresh_chunks)} duplicate chunks")
+        if not fresh_chunks:
+            return
+        chunks, doc_ids = fresh_chunks, fresh_doc_ids
+
         print(f"Adding {len(chunks)} chunks to FAISS index...")
-        
-        # Generate embeddings
+
+        # Generate embeddings in one batched call
         embeddings = self.embedder.embed_batch(chunks)
-        
+
         # Initialize index on first add
         if self.index is None:
             self.dimension = len(embeddings[0])
-            self.index = faiss.IndexFlatIP(self.dimension)  # Inner product (for normalized vectors)
-        
-        # Convert to numpy array and normalize
+            self.index = self._build_index(self.dimension)
+        elif self._index_readonly:
+            # A memory-mapped index can't be added to; rebuild a writable
+            # one from the kept vector matrix (no re-embedding)
+            self.index = self._build_index(self.dimension)
+            if not self.index.is_trained:
+                self.index.train(self.vectors)
+            self.index.add(self.vectors)
+            self._index_readonly = False
+
+        # Convert to numpy array and normalize once; the same rows feed both
+        # the FAISS index and the contiguous matrix
         embeddings_np = np.array(embeddings, dtype=np.float32)
         faiss.normalize_L2(embeddings_np)
-        
-        # Add to index
+
+        # Add to index (the scalar quantizer learns per-dim ranges on the
+        # first batch before anything can be added)
+        if not self.index.is_trained:
+            self.index.train(embeddings_np)
         self.index.add(embeddings_np)
-        
-        # Store chunks and metadata
-        for i, chunk in enumerate(chunks):
-            self.chunks.append(chunk)
-            self.metadata.append({
-                "doc_id": doc_id,
-                "chunk_id": i,
-                "chunk_size": chunk_size,
-                "text": chunk
+        self._append_vectors(embeddings_np)
+        self._maybe_promote_to_hnsw()
+        self._maybe_promote_to_gpu()
+
+        # Store chunks and metadata (chunk_id counts per document). The chunk
+        # text itself lives only in self.chunks — search() re-attaches it to
+        # the returned metadata, so the corpus isn't held in memory twice.
+        doc_chunk_counts: Dict[str, int] = {}
+        metadata = []
+        for chunk_doc_id in doc_ids:
+            chunk_idx = doc_chunk_counts.get(chunk_doc_id, 0)
+            doc_chunk_counts[chunk_doc_id] = chunk_idx + 1
+            metadata.append({
+                "doc_id": chunk_doc_id,
+                "chunk_id": chunk_idx,
+                "chunk_size": chunk_size
             })
-        
+        self.chunks.extend(chunks)
+        self.metadata.extend(metadata)
+        # Invalidate the prefilter; it is rebuilt lazily on the next search
+        self._bm25 = None
+
         print(f"Total chunks in FAISS index: {len(self.chunks)}")
     
+    def _maybe_promote_to_hnsw(self) -> None:
+        """
+        Rebuild the exhaustive flat index as HNSW once the corpus crosses
+        HNSW_AUTO_THRESHOLD. The kept vector matrix makes the rebuild a
+        pure index.add — no re-embedding.
+        """
+        if (
+            HNSW_AUTO_THRESHOLD <= 0
+            or INDEX_BACKEND != "flat"
+            or not isinstance(self.index, faiss.IndexFlatIP)
+            or self._count <= HNSW_AUTO_THRESHOLD
+        ):
+            return
+
+        print(f"Promoting flat index to HNSW at {self._count} chunks...")
+        promoted = faiss.IndexHNSWFlat(self.dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        promoted.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        promoted.add(self.vectors)
+        self.index = promoted
+
+    def _maybe_promote_to_gpu(self) -> None:
+        """
+        Move a large flat index onto the GPU when a CUDA faiss build is
+        installed. Guarded by hasattr because faiss-cpu (the pinned default)
+        doesn't ship StandardGpuResources at all.
+        """
+        if (
+            GPU_THRESHOLD <= 0
+            or self._gpu_res is not None
+            or not isinstance(self.index, faiss.IndexFlatIP)
+            or self._count <= GPU_THRESHOLD
+            or not hasattr(faiss, "StandardGpuResources")
+        ):
+            return
+
+        try:
+            if faiss.get_num_gpus() < 1:
+                return
+            res = faiss.StandardGpuResources()
+            self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
+            self._gpu_res = res
+            self._index_readonly = False
+            print(f"Moved flat index to GPU at {self._count} chunks")
+        except Exception as e:
+            print(f"⚠ GPU index promotion failed, staying on CPU: {e}")
+
     def search(
         self, 
         query: str, 
@@ -82,8 +277,18 @@ class FAISSRetriever:
         query_embedding = self.embedder.embed_query(query)
         query_np = np.array([query_embedding], dtype=np.float32)
         faiss.normalize_L2(query_np)
-        
-        # Search
+
+        # Large corpus: two-tier hybrid search (BM25 prefilter + vector rerank)
+        if (
+            BM25_AVAILABLE
+            and BM25_PREFILTER_THRESHOLD > 0
+            and len(self.chunks) > BM25_PREFILTER_THRESHOLD
+        ):
+            return self._search_prefiltered(query, query_np[0], top_k, min_score)
+
+        # Search (HNSW: widen the candidate beam with top_k)
+        if isinstance(self.index, faiss.IndexHNSWFlat):
+            self.index.hnsw.efSearch = max(64, 2 * top_k)
         k = min(top_k, len(self.chunks))
         scores, indices = self.index.search(query_np, k)
         
@@ -91,37 +296,200 @@ class FAISSRetriever:
         results = []
         for idx, score in zip(indices[0], scores[0]):
             if score >= min_score:
+                # Re-attach the chunk text (stored once, in self.chunks)
+                metadata = dict(self.metadata[idx])
+                metadata["text"] = self.chunks[idx]
                 results.append({
                     "chunk": self.chunks[idx],
                     "score": float(score),
-                    "metadata": self.metadata[idx]
+                    "metadata": metadata
                 })
-        
+
         return results
-    
+
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        min_score: float = 0.0
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for many queries with one multi-query index call
+
+        Embeds all queries in a single batch and hands FAISS a (B, d)
+        matrix, so the index scans (or launches a GPU kernel over) the
+        corpus once for the whole batch instead of once per query.
+
+        Args:
+            queries: Search queries
+            top_k: Number of results per query
+            min_score: Minimum similarity score
+
+        Returns:
+            One result list per query, in input order
+        """
+        if self.index is None or len(self.chunks) == 0 or not queries:
+            return [[] for _ in queries]
+
+        query_np = np.array(self.embedder.embed_batch(queries), dtype=np.float32)
+        faiss.normalize_L2(query_np)
+
+        if isinstance(self.index, faiss.IndexHNSWFlat):
+            self.index.hnsw.efSearch = max(64, 2 * top_k)
+        k = min(top_k, len(self.chunks))
+        scores, indices = self.index.search(query_np, k)
+
+        all_results = []
+        for row_indices, row_scores in zip(indices, scores):
+            results = []
+            for idx, score in zip(row_indices, row_scores):
+                if score >= min_score:
+                    metadata = dict(self.metadata[idx])
+                    metadata["text"] = self.chunks[idx]
+                    results.append({
+                        "chunk": self.chunks[idx],
+                        "score": float(score),
+                        "metadata": metadata
+                    })
+            all_results.append(results)
+
+        return all_results
+
+    def _search_prefiltered(
+        self,
+        query: str,
+        query_vec: np.ndarray,
+        top_k: int,
+        min_score: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Two-tier search: BM25 narrows the corpus to BM25_CANDIDATES lexical
+        candidates, then only those rows are vector-scored with one small
+        matmul against the kept embedding matrix (the FAISS index is bypassed).
+        """
+        if self._bm25 is None:
+            print(f"Building BM25 prefilter over {len(self.chunks)} chunks...")
+            self._bm25 = BM25Okapi([c.lower().split() for c in self.chunks])
+
+        bm25_scores = self._bm25.get_scores(query.lower().split())
+        n_cand = min(BM25_CANDIDATES, len(self.chunks))
+        cand = np.argpartition(-bm25_scores, n_cand - 1)[:n_cand]
+
+        # Exact cosine scores for the candidates only (vectors are normalized)
+        dots = self.vectors[cand] @ query_vec
+        k = min(top_k, n_cand)
+        top_local = np.argpartition(-dots, k - 1)[:k]
+        top_local = top_local[np.argsort(-dots[top_local])]
+
+        results = []
+        for local in top_local:
+            score = float(dots[local])
+            if score < min_score:
+                continue
+            idx = int(cand[local])
+            metadata = dict(self.metadata[idx])
+            metadata["text"] = self.chunks[idx]
+            results.append({
+                "chunk": self.chunks[idx],
+                "score": score,
+                "metadata": metadata
+            })
+
+        return results
+
+    def save(self, path: str) -> None:
+        """
+        Persist the index and chunk state to <path>.faiss / <path>.pkl
+
+        Args:
+            path: Path prefix for the two state files
+        """
+        if self.index is None:
+            return
+        index = self.index
+        if self._gpu_res is not None:
+            # write_index only handles CPU indexes
+            index = faiss.index_gpu_to_cpu(index)
+        faiss.write_index(index, f"{path}.faiss")
+        with open(f"{path}.pkl", "wb") as f:
+            pickle.dump(
+                {
+                    "chunks": self.chunks,
+                    "metadata": self.metadata,
+                    "dimension": self.dimension,
+                    # copy: self.vectors is a view into the growth buffer
+                    "vectors": np.array(self.vectors)
+                },
+                f,
+                protocol=5
+            )
+
+    def load(self, path: str) -> bool:
+        """
+        Restore state written by save(). The index file is memory-mapped,
+        so cold-start cost is one open() and pages fault in per query —
+        but a mapped index is read-only, so further add_documents calls
+        rebuild from the restored vector matrix first.
+
+        Returns:
+            True when both state files existed and were loaded
+        """
+        if not (os.path.exists(f"{path}.faiss") and os.path.exists(f"{path}.pkl")):
+            return False
+
+        self.index = faiss.read_index(
+            f"{path}.faiss", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        )
+        with open(f"{path}.pkl", "rb") as f:
+            state = pickle.load(f)
+
+        self.chunks = state["chunks"]
+        self.metadata = state["metadata"]
+        self.dimension = state["dimension"]
+        vectors = np.ascontiguousarray(state["vectors"], dtype=np.float32)
+        self._vectors = vectors
+        self._count = vectors.shape[0]
+        self._index_readonly = True
+        self._chunk_hashes = {
+            hashlib.blake2b(chunk.encode("utf-8"), digest_size=16).digest()
+            for chunk in self.chunks
+        }
+        return True
+
     def clear(self) -> None:
         """Clear the FAISS index"""
         self.index = None
         self.chunks = []
         self.metadata = []
-    
+        self._vectors = None
+        self._count = 0
+        self._index_readonly = False
+        self._chunk_hashes = set()
+        self._bm25 = None
+        self._gpu_res = None
+
     def get_stats(self) -> Dict[str, Any]:
         """Get retriever statistics"""
         return {
             "total_chunks": len(self.chunks),
             "embedding_dim": self.dimension,
             "has_data": self.index is not None and len(self.chunks) > 0,
-            "index_type": "FAISS IndexFlatIP"
+            "index_type": type(self.index).__name__ if self.index is not None
+                          else ("FAISS IndexHNSWFlat" if INDEX_BACKEND == "hnsw" else "FAISS IndexFlatIP")
         }
 
 
 # Global retriever instance
 _retriever: FAISSRetriever | None = None
+_retriever_lock = threading.Lock()
 
 
 def get_retriever() -> FAISSRetriever:
-    """Get or create retriever instance"""
+    """Get or create retriever instance (double-checked so concurrent first
+    requests can't each construct one and load the embedder twice)"""
     global _retriever
     if _retriever is None:
-        _retriever = FAISSRetriever()
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = FAISSRetriever()
     return _retriever
@@ -0,0 +1,174 @@
+# backend/services/semantic_cache.py
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Cache tuning (overridable via environment)
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+
+
+class SemanticQueryCache:
+    """
+    Semantic cache for full RAG responses.
+
+    Stores L2-normalized query embeddings in a single float32 matrix and a
+    parallel list of response payloads. A lookup is one matrix-vector product;
+    if the best cosine score clears the threshold AND the entry belongs to the
+    same namespace (doc set, chunk size, model), the cached payload is returned
+    and the whole retrieval + generation pipeline is skipped.
+    """
+
+    def __init__(
+        self,
+        threshold: float = CACHE_SIMILARITY_THRESHOLD,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._matrix: Optional[np.ndarray] = None  # (N, D) float32, L2-normalized
+        self._entries: List[Dict[str, Any]] = []
+        self._namespaces: List[Tuple] = []
+        self._created: List[float] = []
+        self._last_used: List[float] = []
+
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_namespace(
+        doc_ids: List[str],
+        chunk_size: int,
+        model_name: str,
+        overlap_percent: int,
+        top_k: int,
+        temperature: float
+    ) -> Tuple:
+        """Build a namespace key so hits only apply to identical configs:
+        every request parameter that changes the correct response is part
+        of the key"""
+        return (
+            tuple(sorted(doc_ids)),
+            chunk_size,
+            model_name,
+            overlap_percent,
+            top_k,
+            temperature
+        )
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _drop_indices(self, indices: List[int]) -> None:
+        """Remove entries at the given indices (caller holds the lock)"""
+        if not indices:
+            return
+        keep = [i for i in range(len(self._entries)) if i not in set(indices)]
+        self._entries = [self._entries[i] for i in keep]
+        self._namespaces = [self._namespaces[i] for i in keep]
+        self._created = [self._created[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def _prune_expired(self, now: float) -> None:
+        expired = [
+            i for i, created in enumerate(self._created)
+            if now - created > self.ttl_seconds
+        ]
+        self._drop_indices(expired)
+
+    def get(self, query_embedding: List[float], namespace: Tuple) -> Optional[Dict[str, Any]]:
+        """Return a cached payload for a semantically similar query, or None"""
+        query_vec = self._normalize(query_embedding)
+
+        with self._lock:
+            now = time.time()
+            self._prune_expired(now)
+
+            if self._matrix is None or len(self._entries) == 0:
+                self._misses += 1
+                return None
+
+            scores = self._matrix @ query_vec
+
+            # Sort only the (usually few) entries above the threshold instead
+            # of argsort-ing the whole cache: O(N + k log k) vs O(N log N)
+            candidates = np.nonzero(scores >= self.threshold)[0]
+            if candidates.size == 0:
+                self._misses += 1
+                return None
+
+            # Only consider entries from the same namespace
+            for idx in candidates[np.argsort(-scores[candidates])]:
+                if self._namespaces[idx] == namespace:
+                    self._last_used[idx] = now
+                    self._hits += 1
+                    return dict(self._entries[idx])
+
+            self._misses += 1
+            return None
+
+    def put(self, query_embedding: List[float], namespace: Tuple, payload: Dict[str, Any]) -> None:
+        """Store a response payload under the query embedding"""
+        query_vec = self._normalize(query_embedding)
+
+        with self._lock:
+            now = time.time()
+            self._prune_expired(now)
+
+            # Evict least-recently-used entry when full
+            if len(self._entries) >= self.max_entries:
+                lru_idx = int(np.argmin(self._last_used))
+                self._drop_indices([lru_idx])
+
+            self._entries.append(dict(payload))
+            self._namespaces.append(namespace)
+            self._created.append(now)
+            self._last_used.append(now)
+
+            row = query_vec.reshape(1, -1)
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._matrix = None
+            self._entries = []
+            self._namespaces = []
+            self._created = []
+            self._last_used = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses
+            }
+
+
+# Global cache instance
+_query_cache: Optional[SemanticQueryCache] = None
+
+
+def get_query_cache() -> SemanticQueryCache:
+    """Get or create the semantic query cache"""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = SemanticQueryCache()
+    return _query_cache